@@ -1,16 +1,43 @@
-from typing import Optional
-from openai import OpenAI
-from anthropic import Anthropic
+import asyncio
+from typing import Awaitable, Callable, Optional
+from openai import AsyncOpenAI
+from anthropic import AsyncAnthropic
 from app.config import settings
 
+# How often the client connection is checked while waiting on the provider
+DISCONNECT_POLL_SECONDS = 0.5
+
+OPENAI_MODEL = "gpt-4o-mini"
+CLAUDE_MODEL = "claude-3-5-sonnet-20241022"
+
+class StreamProgress:
+    """Text and model streamed so far, still readable after the provider call is cancelled."""
+    
+    def __init__(self):
+        self.chunks: list[str] = []
+        self.model_used: Optional[str] = None
+    
+    @property
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+class GenerationAborted(Exception):
+    """Raised when a generation is stopped early by a client disconnect or deadline."""
+    
+    def __init__(self, reason: str, partial_content: str, model_used: str):
+        super().__init__(f"Generation {reason}")
+        self.reason = reason  # cancelled, timed_out
+        self.partial_content = partial_content
+        self.model_used = model_used
+
 class AIContentGenerator:
     def __init__(self):
         print(f"🤖 Initializing AIContentGenerator...")
         print(f"🤖 OPENAI_API_KEY present: {bool(settings.OPENAI_API_KEY)}")
         print(f"🤖 ANTHROPIC_API_KEY present: {bool(settings.ANTHROPIC_API_KEY)}")
         
-        self.openai_client = OpenAI(api_key=settings.OPENAI_API_KEY) if settings.OPENAI_API_KEY else None
-        self.anthropic_client = Anthropic(api_key=settings.ANTHROPIC_API_KEY) if settings.ANTHROPIC_API_KEY else None
+        self.openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY) if settings.OPENAI_API_KEY else None
+        self.anthropic_client = AsyncAnthropic(api_key=settings.ANTHROPIC_API_KEY) if settings.ANTHROPIC_API_KEY else None
         
         print(f"🤖 OpenAI client created: {self.openai_client is not None}")
         print(f"🤖 Anthropic client created: {self.anthropic_client is not None}")
@@ -47,29 +74,38 @@ Output only the final content, no explanations or meta-commentary. Make it engag
         length: str,
         product: str,
         audience: str,
-        extra_instructions: Optional[str] = None
+        extra_instructions: Optional[str] = None,
+        progress: Optional[StreamProgress] = None
     ) -> tuple[str, str]:
-        """Generate content using OpenAI GPT."""
+        """Generate content using OpenAI GPT, streaming text into progress as it arrives."""
         if not self.openai_client:
             raise ValueError("OpenAI API key not configured")
         
         system_prompt = self._build_system_prompt(content_type, tone, length)
         user_prompt = self._build_user_prompt(product, audience, extra_instructions)
+        progress = progress if progress is not None else StreamProgress()
+        progress.model_used = OPENAI_MODEL
         
-        response = self.openai_client.chat.completions.create(
-            model="gpt-4o-mini",
+        stream = await self.openai_client.chat.completions.create(
+            model=OPENAI_MODEL,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
             temperature=0.7,
-            max_tokens=2000
+            max_tokens=2000,
+            stream=True
         )
+        try:
+            async for chunk in stream:
+                progress.model_used = chunk.model or progress.model_used
+                if chunk.choices and chunk.choices[0].delta.content:
+                    progress.chunks.append(chunk.choices[0].delta.content)
+        finally:
+            # Closes the HTTP response so a cancelled generation stops upstream too
+            await stream.close()
         
-        content = response.choices[0].message.content
-        model_used = response.model
-        
-        return content, model_used
+        return progress.text, progress.model_used
     
     async def generate_with_claude(
         self,
@@ -78,28 +114,65 @@ Output only the final content, no explanations or meta-commentary. Make it engag
         length: str,
         product: str,
         audience: str,
-        extra_instructions: Optional[str] = None
+        extra_instructions: Optional[str] = None,
+        progress: Optional[StreamProgress] = None
     ) -> tuple[str, str]:
-        """Generate content using Anthropic Claude."""
+        """Generate content using Anthropic Claude, streaming text into progress as it arrives."""
         if not self.anthropic_client:
             raise ValueError("Anthropic API key not configured")
         
         system_prompt = self._build_system_prompt(content_type, tone, length)
         user_prompt = self._build_user_prompt(product, audience, extra_instructions)
+        progress = progress if progress is not None else StreamProgress()
+        progress.model_used = CLAUDE_MODEL
         
-        response = self.anthropic_client.messages.create(
-            model="claude-3-5-sonnet-20241022",
+        async with self.anthropic_client.messages.stream(
+            model=CLAUDE_MODEL,
             max_tokens=2000,
             system=system_prompt,
             messages=[
                 {"role": "user", "content": user_prompt}
             ]
-        )
-        
-        content = response.content[0].text
-        model_used = response.model
+        ) as stream:
+            async for text in stream.text_stream:
+                progress.chunks.append(text)
+            message = await stream.get_final_message()
         
-        return content, model_used
+        progress.model_used = message.model
+        return progress.text, progress.model_used
+    
+    async def _generate_with_provider(
+        self,
+        content_type: str,
+        tone: str,
+        length: str,
+        product: str,
+        audience: str,
+        extra_instructions: Optional[str],
+        preferred_model: str,
+        progress: StreamProgress
+    ) -> tuple[str, str]:
+        """Dispatch to the preferred provider, falling back to any configured one."""
+        if preferred_model == "openai" and self.openai_client:
+            return await self.generate_with_openai(
+                content_type, tone, length, product, audience, extra_instructions, progress
+            )
+        elif preferred_model == "claude" and self.anthropic_client:
+            return await self.generate_with_claude(
+                content_type, tone, length, product, audience, extra_instructions, progress
+            )
+        else:
+            # Fallback to any available client
+            if self.openai_client:
+                return await self.generate_with_openai(
+                    content_type, tone, length, product, audience, extra_instructions, progress
+                )
+            elif self.anthropic_client:
+                return await self.generate_with_claude(
+                    content_type, tone, length, product, audience, extra_instructions, progress
+                )
+            else:
+                raise ValueError("No AI API keys configured. Please set OPENAI_API_KEY or ANTHROPIC_API_KEY")
     
     async def generate(
         self,
@@ -109,9 +182,17 @@ Output only the final content, no explanations or meta-commentary. Make it engag
         product: str,
         audience: str,
         extra_instructions: Optional[str] = None,
-        preferred_model: str = "openai"
+        preferred_model: str = "openai",
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        timeout: Optional[float] = None
     ) -> tuple[str, str]:
-        """Generate content using the preferred AI model."""
+        """
+        Generate content using the preferred AI model.
+        
+        The provider call is cancelled (closing its HTTP stream) as soon as
+        is_disconnected() reports the client has gone or the timeout budget is
+        spent; GenerationAborted then carries whatever text had streamed in.
+        """
         
         # FOR DEMO/TESTING: Use mock content if no API keys are configured
         if not self.openai_client and not self.anthropic_client:
@@ -119,27 +200,41 @@ Output only the final content, no explanations or meta-commentary. Make it engag
             mock_content = self._generate_mock_content(content_type, tone, product, audience)
             return mock_content, "mock-demo-model"
         
+        progress = StreamProgress()
+        task = asyncio.create_task(self._generate_with_provider(
+            content_type, tone, length, product, audience, extra_instructions, preferred_model, progress
+        ))
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout else None
+        reason = None
+        
         try:
-            if preferred_model == "openai" and self.openai_client:
-                return await self.generate_with_openai(
-                    content_type, tone, length, product, audience, extra_instructions
-                )
-            elif preferred_model == "claude" and self.anthropic_client:
-                return await self.generate_with_claude(
-                    content_type, tone, length, product, audience, extra_instructions
-                )
-            else:
-                # Fallback to any available client
-                if self.openai_client:
-                    return await self.generate_with_openai(
-                        content_type, tone, length, product, audience, extra_instructions
-                    )
-                elif self.anthropic_client:
-                    return await self.generate_with_claude(
-                        content_type, tone, length, product, audience, extra_instructions
-                    )
-                else:
-                    raise ValueError("No AI API keys configured. Please set OPENAI_API_KEY or ANTHROPIC_API_KEY")
+            while not task.done():
+                wait_for = DISCONNECT_POLL_SECONDS if is_disconnected else None
+                if deadline is not None:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        reason = "timed_out"
+                        break
+                    wait_for = min(wait_for, remaining) if wait_for else remaining
+                await asyncio.wait({task}, timeout=wait_for)
+                if not task.done() and is_disconnected and await is_disconnected():
+                    # The provider may have finished while the probe was awaited
+                    if not task.done():
+                        reason = "cancelled"
+                    break
+        finally:
+            # Also covers this coroutine itself being cancelled by the server
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        
+        if reason:
+            print(f"⚠️  Generation {reason} after {len(progress.chunks)} streamed chunks")
+            raise GenerationAborted(reason, progress.text, progress.model_used or preferred_model)
+        
+        try:
+            return task.result()
         except Exception as e:
             raise Exception(f"AI generation failed: {str(e)}")
     
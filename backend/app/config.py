@@ -1,5 +1,6 @@
+from pydantic import PositiveInt
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Literal, Optional
 from dotenv import load_dotenv
 import os
 from pathlib import Path
@@ -30,6 +31,21 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY")
     ANTHROPIC_API_KEY: Optional[str] = os.getenv("ANTHROPIC_API_KEY")
     
+    # Per-request budget for the AI provider call; slow calls are cancelled
+    GENERATION_TIMEOUT_SECONDS: float = 90
+    
+    # Idempotency keys for /api/generate
+    IDEMPOTENCY_KEY_TTL_HOURS: int = 24  # how long completed responses are replayed
+    IDEMPOTENCY_LOCK_SECONDS: int = 300  # in-flight claim expires if the worker dies
+    IDEMPOTENCY_WAIT_SECONDS: int = 120  # how long a retry waits on the original
+    IDEMPOTENCY_DISCONNECT_GRACE_SECONDS: float = 5  # wait for a retry before cancelling on disconnect
+    
+    # History retention (0 disables purging of old generations)
+    HISTORY_RETENTION_DAYS: int = 0
+    HISTORY_RETENTION_MODE: Literal["delete", "archive"] = "delete"
+    RETENTION_SWEEP_INTERVAL_MINUTES: PositiveInt = 60
+    DELETE_BATCH_SIZE: PositiveInt = 500  # rows per transaction for bulk and retention deletes
+    
     # Server
     HOST: str = "0.0.0.0"
     PORT: int = 8000
@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
@@ -8,6 +9,49 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# Columns and indexes added after the first release. create_all() only
+# creates missing tables, so existing databases get these through upgrade_schema().
+ADDED_COLUMNS = [
+    ("content_generations", "status", "VARCHAR(20) NOT NULL DEFAULT 'completed'"),
+]
+ADDED_INDEXES = [
+    ("content_generations", "ix_content_generations_created_at", "created_at"),
+]
+
+def _has_column(bind, table: str, column: str) -> bool:
+    return column in {c["name"] for c in inspect(bind).get_columns(table)}
+
+def _has_index(bind, table: str, index: str) -> bool:
+    return index in {i["name"] for i in inspect(bind).get_indexes(table)}
+
+def upgrade_schema(bind=engine):
+    """
+    Idempotently add columns and indexes that create_all() cannot add to existing tables.
+    
+    Every worker runs this at startup, so another worker may apply a change
+    between our check and our DDL. Each statement runs in its own transaction,
+    and a failure is ignored if a re-check shows the change is now present.
+    """
+    for table, column, ddl in ADDED_COLUMNS:
+        if not inspect(bind).has_table(table) or _has_column(bind, table, column):
+            continue
+        print(f"🗄️  Adding column {table}.{column}")
+        try:
+            with bind.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+        except DBAPIError:
+            if not _has_column(bind, table, column):
+                raise
+    for table, index, columns in ADDED_INDEXES:
+        if not inspect(bind).has_table(table):
+            continue
+        try:
+            with bind.begin() as conn:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index} ON {table} ({columns})"))
+        except DBAPIError:
+            if not _has_index(bind, table, index):
+                raise
+
 def get_db():
     db = SessionLocal()
     try:
@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import IdempotencyKey
+
+STATUS_IN_PROGRESS = "in_progress"
+STATUS_COMPLETED = "completed"
+
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL_SECONDS = 0.5
+RETRY_CHECK_INTERVAL_SECONDS = 0.1
+
+# Requests currently being generated by this worker, keyed by (user_id, key).
+# Retries landing on the same worker await these instead of polling the database.
+_in_flight: dict[tuple[int, str], asyncio.Future] = {}
+# Number of retries currently attached to each in-flight request
+_attached: dict[tuple[int, str], int] = {}
+
+def hash_request(payload: dict) -> str:
+    """Fingerprint a request body so a reused key with different input can be rejected."""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+async def wait_for_retry(user_id: int, key: str, grace_seconds: float) -> bool:
+    """
+    Wait up to grace_seconds for a retry of this request to attach on this
+    worker. Returns True once one is attached, False if none arrived.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + grace_seconds
+    while True:
+        if _attached.get((user_id, key), 0) > 0:
+            return True
+        if loop.time() >= deadline:
+            return False
+        await asyncio.sleep(min(RETRY_CHECK_INTERVAL_SECONDS, max(deadline - loop.time(), 0)))
+
+def _get_live_record(db: Session, user_id: int, key: str) -> Optional[IdempotencyKey]:
+    return db.query(IdempotencyKey)\
+        .filter(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.key == key,
+            IdempotencyKey.expires_at > datetime.utcnow()
+        )\
+        .first()
+
+def _claim(db: Session, user_id: int, key: str, request_hash: str) -> tuple[Optional[IdempotencyKey], bool]:
+    """Return (record, claimed). claimed is True when this request owns the key."""
+    existing = _get_live_record(db, user_id, key)
+    if existing:
+        return existing, False
+
+    # Any remaining row for this key has expired and may be replaced
+    db.query(IdempotencyKey)\
+        .filter(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)\
+        .delete(synchronize_session=False)
+    record = IdempotencyKey(
+        user_id=user_id,
+        key=key,
+        request_hash=request_hash,
+        status=STATUS_IN_PROGRESS,
+        expires_at=datetime.utcnow() + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+    )
+    db.add(record)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another worker claimed the key between our lookup and insert
+        db.rollback()
+        return _get_live_record(db, user_id, key), False
+    return record, True
+
+def _release(db: Session, record: IdempotencyKey) -> None:
+    """Drop an in-flight claim so the client can retry after a failure."""
+    try:
+        db.rollback()
+        db.query(IdempotencyKey)\
+            .filter(IdempotencyKey.id == record.id)\
+            .delete(synchronize_session=False)
+        db.commit()
+        if record in db:
+            db.expunge(record)
+    except Exception as e:
+        # The claim still expires after IDEMPOTENCY_LOCK_SECONDS
+        db.rollback()
+        print(f"⚠️  Could not release idempotency key {record.key}: {e}")
+
+async def _wait_for_original(db: Session, user_id: int, key: str) -> dict:
+    """Attach to a request that is still running and return its response."""
+    future = _in_flight.get((user_id, key))
+    if future is not None:
+        _attached[(user_id, key)] = _attached.get((user_id, key), 0) + 1
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(future), timeout=settings.IDEMPOTENCY_WAIT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with this Idempotency-Key is still in progress",
+                headers={"Retry-After": "5"}
+            )
+        finally:
+            _attached[(user_id, key)] -= 1
+            if not _attached[(user_id, key)]:
+                del _attached[(user_id, key)]
+
+    # The original is running on another worker, so poll the shared table
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while loop.time() < deadline:
+        await asyncio.sleep(POLL_INTERVAL_SECONDS)
+        db.expire_all()
+        record = _get_live_record(db, user_id, key)
+        if record is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="The original request with this Idempotency-Key failed; retry"
+            )
+        if record.status == STATUS_COMPLETED:
+            return json.loads(record.response_body)
+
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="A request with this Idempotency-Key is still in progress",
+        headers={"Retry-After": "5"}
+    )
+
+async def run_idempotent(
+    db: Session,
+    user_id: int,
+    key: str,
+    request_hash: str,
+    produce: Callable[[], Awaitable[dict]]
+) -> dict:
+    """
+    Run produce() at most once per (user, Idempotency-Key).
+
+    A retry arriving while the original is running waits for its result, and
+    one arriving after completion gets the stored response without calling
+    the AI provider again.
+    """
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters"
+        )
+
+    record, claimed = _claim(db, user_id, key, request_hash)
+    if not claimed:
+        if record is None:
+            # The concurrent claim was released before we could read it
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="The original request with this Idempotency-Key failed; retry"
+            )
+        if record.request_hash != request_hash:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key was already used with a different request body"
+            )
+        if record.status == STATUS_COMPLETED:
+            return json.loads(record.response_body)
+        return await _wait_for_original(db, user_id, key)
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[(user_id, key)] = future
+    try:
+        try:
+            body = await produce()
+            record.status = STATUS_COMPLETED
+            record.response_body = json.dumps(body)
+            record.expires_at = datetime.utcnow() + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+            db.commit()
+        except Exception as e:
+            # Wake attached retries before touching the database again
+            future.set_exception(e)
+            future.exception()  # mark retrieved when no retry is attached
+            _release(db, record)
+            raise
+        except asyncio.CancelledError:
+            future.set_exception(HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="The original request with this Idempotency-Key was cancelled; retry"
+            ))
+            future.exception()
+            _release(db, record)
+            raise
+
+        future.set_result(body)
+        return body
+    finally:
+        _in_flight.pop((user_id, key), None)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -27,7 +27,41 @@ class ContentGeneration(Base):
     extra_instructions = Column(Text)
     generated_content = Column(Text, nullable=False)
     model_used = Column(String(50), nullable=False)  # gpt-4, claude-3, etc.
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    status = Column(String(20), nullable=False, default="completed", server_default="completed")  # completed, cancelled, timed_out
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)  # indexed for history and retention scans
     
     # Relationship
     user = relationship("User", back_populates="generations")
+
+class ContentGenerationArchive(Base):
+    """Generations moved out of content_generations by the retention sweeper."""
+    __tablename__ = "content_generations_archive"
+    
+    id = Column(Integer, primary_key=True)  # same id as the original row
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    content_type = Column(String(50), nullable=False)
+    tone = Column(String(50), nullable=False)
+    length = Column(String(20), nullable=False)
+    product = Column(String(255))
+    audience = Column(String(255))
+    extra_instructions = Column(Text)
+    generated_content = Column(Text, nullable=False)
+    model_used = Column(String(50), nullable=False)
+    status = Column(String(20), nullable=False)
+    created_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_key"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String(255), nullable=False)
+    request_hash = Column(String(64), nullable=False)  # sha256 of the request body
+    status = Column(String(20), nullable=False)  # in_progress, completed
+    response_body = Column(Text)  # serialized GenerateResponse once completed
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import ContentGeneration, ContentGenerationArchive, IdempotencyKey
+
+# Short pause between batches so the sweeper never hogs the table
+BATCH_PAUSE_SECONDS = 0.05
+
+ARCHIVE_COLUMNS = [
+    "id", "user_id", "content_type", "tone", "length", "product", "audience",
+    "extra_instructions", "generated_content", "model_used", "status", "created_at"
+]
+
+def _stopped(stop: Optional[threading.Event]) -> bool:
+    return stop is not None and stop.is_set()
+
+def delete_in_batches(
+    db: Session,
+    model,
+    filters: list,
+    batch_size: Optional[int] = None,
+    pause: float = 0,
+    stop: Optional[threading.Event] = None
+) -> int:
+    """
+    Delete every row of model matching filters with set-based DELETEs of at
+    most batch_size rows, committing after each batch. Returns rows deleted.
+    Setting stop ends the loop before the next batch.
+    """
+    batch_size = batch_size or settings.DELETE_BATCH_SIZE
+    total = 0
+    while not _stopped(stop):
+        batch_ids = select(model.id).where(*filters).limit(batch_size).scalar_subquery()
+        result = db.execute(
+            delete(model)
+            .where(model.id.in_(batch_ids))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            return total
+        if pause:
+            time.sleep(pause)
+    return total
+
+def archive_in_batches(
+    db: Session,
+    filters: list,
+    batch_size: Optional[int] = None,
+    pause: float = 0,
+    stop: Optional[threading.Event] = None
+) -> int:
+    """Move matching generations to the archive table, one small transaction per batch."""
+    batch_size = batch_size or settings.DELETE_BATCH_SIZE
+    columns = [getattr(ContentGeneration, name) for name in ARCHIVE_COLUMNS]
+    total = 0
+    while not _stopped(stop):
+        # Every worker runs a sweeper; SKIP LOCKED gives concurrent sweepers
+        # disjoint batches so they never archive the same id twice
+        ids = db.scalars(
+            select(ContentGeneration.id)
+            .where(*filters)
+            .order_by(ContentGeneration.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not ids:
+            return total
+        db.execute(
+            insert(ContentGenerationArchive)
+            .from_select(ARCHIVE_COLUMNS, select(*columns).where(ContentGeneration.id.in_(ids)))
+        )
+        db.execute(
+            delete(ContentGeneration)
+            .where(ContentGeneration.id.in_(ids))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        total += len(ids)
+        if len(ids) < batch_size:
+            return total
+        if pause:
+            time.sleep(pause)
+    return total
+
+def sweep_once(stop: Optional[threading.Event] = None, session_factory=SessionLocal) -> dict:
+    """Run one retention pass: expired idempotency keys, then old generations."""
+    db = session_factory()
+    try:
+        now = datetime.utcnow()
+        counts = {
+            "idempotency_keys": delete_in_batches(
+                db, IdempotencyKey, [IdempotencyKey.expires_at <= now],
+                pause=BATCH_PAUSE_SECONDS, stop=stop
+            ),
+            "generations": 0
+        }
+        if settings.HISTORY_RETENTION_DAYS > 0 and not _stopped(stop):
+            cutoff = [ContentGeneration.created_at < now - timedelta(days=settings.HISTORY_RETENTION_DAYS)]
+            if settings.HISTORY_RETENTION_MODE == "archive":
+                counts["generations"] = archive_in_batches(
+                    db, cutoff, pause=BATCH_PAUSE_SECONDS, stop=stop
+                )
+            else:
+                counts["generations"] = delete_in_batches(
+                    db, ContentGeneration, cutoff, pause=BATCH_PAUSE_SECONDS, stop=stop
+                )
+        return counts
+    finally:
+        db.close()
+
+async def retention_sweeper(stop: threading.Event):
+    """
+    Background loop started from the app lifespan; runs sweep_once periodically.
+    
+    On shutdown the lifespan sets stop and cancels this task. A sweep already
+    running in its thread finishes its current batch and is awaited, so no
+    database work continues after shutdown.
+    """
+    while not stop.is_set():
+        # Sync DB work runs in a thread so request handling is not blocked
+        sweep = asyncio.ensure_future(asyncio.to_thread(sweep_once, stop))
+        try:
+            counts = await asyncio.shield(sweep)
+            if any(counts.values()):
+                print(f"🧹 Retention sweep removed {counts}")
+        except asyncio.CancelledError:
+            stop.set()
+            await asyncio.gather(sweep, return_exceptions=True)
+            raise
+        except Exception as e:
+            print(f"⚠️  Retention sweep failed: {e}")
+        await asyncio.sleep(settings.RETENTION_SWEEP_INTERVAL_MINUTES * 60)
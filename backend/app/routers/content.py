@@ -1,25 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete
 from sqlalchemy.orm import Session
-from typing import List
+from datetime import datetime
+from typing import Awaitable, Callable, List, Literal, Optional
 
+from app.config import settings
 from app.database import get_db
 from app.models import User, ContentGeneration
-from app.schemas import GenerateRequest, GenerateResponse, ContentResponse
+from app.schemas import GenerateRequest, GenerateResponse, ContentResponse, BulkDeleteResponse
 from app.auth import get_current_user
-from app.ai_service import get_ai_generator
+from app.ai_service import GenerationAborted, get_ai_generator
+from app.idempotency import hash_request, run_idempotent, wait_for_retry
+from app.retention import delete_in_batches
+
+# nginx convention for "client closed request"; Starlette has no constant for it
+HTTP_499_CLIENT_CLOSED_REQUEST = 499
 
 router = APIRouter()
 
-@router.post("/generate", response_model=GenerateResponse)
-async def generate_content(
+async def _generate_and_store(
     request: GenerateRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """Generate AI content based on user input."""
-    print(f"📝 Generate content request received from user {current_user.email}")
-    print(f"📝 Request: {request.content_type}, {request.tone}, {request.length}")
-    
+    db: Session,
+    current_user: User,
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None
+) -> dict:
+    """Call the AI provider, save the result and return the serialized response."""
+    aborted = None
     try:
         # Get the AI generator instance
         print("📝 Getting AI generator...")
@@ -28,15 +35,22 @@ async def generate_content(
         
         # Generate content using AI
         print("📝 Calling AI generation...")
-        generated_text, model_used = await ai_gen.generate(
-            content_type=request.content_type,
-            tone=request.tone,
-            length=request.length,
-            product=request.product,
-            audience=request.audience,
-            extra_instructions=request.extra_instructions,
-            preferred_model="openai"  # Can be made configurable
-        )
+        try:
+            generated_text, model_used = await ai_gen.generate(
+                content_type=request.content_type,
+                tone=request.tone,
+                length=request.length,
+                product=request.product,
+                audience=request.audience,
+                extra_instructions=request.extra_instructions,
+                preferred_model="openai",  # Can be made configurable
+                is_disconnected=is_disconnected,
+                timeout=settings.GENERATION_TIMEOUT_SECONDS
+            )
+        except GenerationAborted as e:
+            # Keep whatever streamed in so the aborted attempt is visible in history
+            aborted = e
+            generated_text, model_used = e.partial_content, e.model_used
         
         # Save to database
         new_generation = ContentGeneration(
@@ -48,19 +62,72 @@ async def generate_content(
             audience=request.audience,
             extra_instructions=request.extra_instructions,
             generated_content=generated_text,
-            model_used=model_used
+            model_used=model_used,
+            status=aborted.reason if aborted else "completed"
         )
         db.add(new_generation)
         db.commit()
         db.refresh(new_generation)
-        
-        return new_generation
     
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Content generation failed: {str(e)}"
         )
+    
+    if aborted and aborted.reason == "timed_out":
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"Content generation exceeded {settings.GENERATION_TIMEOUT_SECONDS:g}s and was cancelled"
+        )
+    if aborted:
+        raise HTTPException(
+            status_code=HTTP_499_CLIENT_CLOSED_REQUEST,
+            detail="Client disconnected; generation was cancelled"
+        )
+    
+    return GenerateResponse.model_validate(new_generation).model_dump(mode="json")
+
+@router.post("/generate", response_model=GenerateResponse)
+async def generate_content(
+    request: GenerateRequest,
+    http_request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """
+    Generate AI content based on user input.
+    
+    Clients may send an Idempotency-Key header so that retries of the same
+    request reuse the original generation instead of calling the AI again.
+    The provider call is cancelled when the client disconnects; with a key it
+    first waits IDEMPOTENCY_DISCONNECT_GRACE_SECONDS for a retry to attach,
+    since retries are only sent after the first connection has dropped.
+    """
+    print(f"📝 Generate content request received from user {current_user.email}")
+    print(f"📝 Request: {request.content_type}, {request.tone}, {request.length}")
+    
+    if idempotency_key is None:
+        return await _generate_and_store(
+            request, db, current_user, is_disconnected=http_request.is_disconnected
+        )
+    
+    async def is_abandoned() -> bool:
+        if not await http_request.is_disconnected():
+            return False
+        # Retries on other workers poll the table and cannot be seen here
+        return not await wait_for_retry(
+            current_user.id, idempotency_key, settings.IDEMPOTENCY_DISCONNECT_GRACE_SECONDS
+        )
+    
+    return await run_idempotent(
+        db,
+        user_id=current_user.id,
+        key=idempotency_key,
+        request_hash=hash_request(request.model_dump()),
+        produce=lambda: _generate_and_store(request, db, current_user, is_disconnected=is_abandoned)
+    )
 
 @router.get("/history", response_model=List[ContentResponse])
 async def get_history(
@@ -99,6 +166,41 @@ async def get_content_by_id(
     
     return content
 
+@router.delete("/history", response_model=BulkDeleteResponse)
+async def delete_history(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    ids: Optional[List[int]] = Query(None),
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    content_type: Optional[Literal["blog", "email", "social"]] = None
+):
+    """
+    Delete the user's generations matching all given filters.
+    
+    At least one filter is required so an empty request cannot wipe the
+    whole history. Rows are removed with batched set-based DELETEs.
+    """
+    filters = [ContentGeneration.user_id == current_user.id]
+    if ids:
+        filters.append(ContentGeneration.id.in_(ids))
+    if created_after:
+        filters.append(ContentGeneration.created_at >= created_after)
+    if created_before:
+        filters.append(ContentGeneration.created_at < created_before)
+    if content_type:
+        filters.append(ContentGeneration.content_type == content_type)
+    
+    if len(filters) == 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide at least one of ids, created_after, created_before or content_type"
+        )
+    
+    # Batched sync deletes run in the threadpool so the event loop stays free
+    deleted = await run_in_threadpool(delete_in_batches, db, ContentGeneration, filters)
+    return {"deleted": deleted}
+
 @router.delete("/history/{content_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_content(
     content_id: int,
@@ -106,20 +208,22 @@ async def delete_content(
     current_user: User = Depends(get_current_user)
 ):
     """Delete a content generation."""
-    content = db.query(ContentGeneration)\
-        .filter(
+    result = db.execute(
+        delete(ContentGeneration)
+        .where(
             ContentGeneration.id == content_id,
             ContentGeneration.user_id == current_user.id
-        )\
-        .first()
+        )
+        .execution_options(synchronize_session=False)
+    )
     
-    if not content:
+    if result.rowcount == 0:
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Content not found"
         )
     
-    db.delete(content)
     db.commit()
     
     return None
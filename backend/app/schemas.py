@@ -39,6 +39,7 @@ class GenerateResponse(BaseModel):
     id: int
     generated_content: str
     model_used: str
+    status: str = "completed"
     created_at: datetime
     
     class Config:
@@ -54,7 +55,11 @@ class ContentResponse(BaseModel):
     extra_instructions: Optional[str]
     generated_content: str
     model_used: str
+    status: str = "completed"
     created_at: datetime
     
     class Config:
         from_attributes = True
+
+class BulkDeleteResponse(BaseModel):
+    deleted: int
@@ -1,22 +1,32 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
+import asyncio
+import threading
 import uvicorn
 
-from app.database import engine
+from app.database import engine, upgrade_schema
 from app.models import Base
+from app.retention import retention_sweeper
 from app.routers import auth, content, health
 
-# Create database tables
+# Create database tables and bring existing ones up to date
 Base.metadata.create_all(bind=engine)
+upgrade_schema(engine)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("🚀 Starting AI Content Generation Platform API...")
+    stop_sweeper = threading.Event()
+    sweeper = asyncio.create_task(retention_sweeper(stop_sweeper))
     yield
     # Shutdown
     print("🛑 Shutting down...")
+    stop_sweeper.set()
+    sweeper.cancel()
+    with suppress(asyncio.CancelledError):
+        await sweeper
 
 app = FastAPI(
     title="AI Content Generation Platform API",
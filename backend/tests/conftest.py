@@ -0,0 +1,46 @@
+import os
+
+# Use a throwaway database and no provider keys before the app is imported
+os.environ["DATABASE_URL"] = "sqlite://"
+os.environ["OPENAI_API_KEY"] = ""
+os.environ["ANTHROPIC_API_KEY"] = ""
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import idempotency
+from app.database import Base
+from app.models import User
+
+@pytest.fixture
+def db():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+@pytest.fixture
+def user(db):
+    user = User(email="test@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+@pytest.fixture(autouse=True)
+def reset_idempotency_state():
+    idempotency._in_flight.clear()
+    idempotency._attached.clear()
+    yield
+    idempotency._in_flight.clear()
+    idempotency._attached.clear()
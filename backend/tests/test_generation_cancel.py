@@ -0,0 +1,187 @@
+import asyncio
+from typing import Optional
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from app.ai_service import AIContentGenerator, GenerationAborted, StreamProgress
+from app.auth import get_current_user
+from app.config import settings
+from app.database import get_db
+from app.models import ContentGeneration, IdempotencyKey
+from app.routers import content
+from app.schemas import GenerateRequest
+
+GENERATE_ARGS = dict(content_type="blog", tone="casual", length="short", product="Widget", audience="devs")
+
+class SlowStreamingGenerator(AIContentGenerator):
+    """Generator whose "OpenAI" provider streams one chunk every delay seconds."""
+
+    def __init__(self, chunk_count: int = 20, delay: float = 0.05):
+        self.openai_client = object()
+        self.anthropic_client = None
+        self.chunk_count = chunk_count
+        self.delay = delay
+        self.provider_cancelled = False
+
+    async def generate_with_openai(
+        self,
+        content_type: str,
+        tone: str,
+        length: str,
+        product: str,
+        audience: str,
+        extra_instructions: Optional[str] = None,
+        progress: Optional[StreamProgress] = None
+    ) -> tuple[str, str]:
+        progress = progress if progress is not None else StreamProgress()
+        progress.model_used = "stub-model"
+        try:
+            for i in range(self.chunk_count):
+                await asyncio.sleep(self.delay)
+                progress.chunks.append(f"word{i} ")
+        except asyncio.CancelledError:
+            self.provider_cancelled = True
+            raise
+        return progress.text, progress.model_used
+
+def full_text(chunk_count: int) -> str:
+    return "".join(f"word{i} " for i in range(chunk_count))
+
+async def disconnected() -> bool:
+    return True
+
+class FakeHTTPRequest:
+    """Stands in for starlette's Request when calling the route directly."""
+
+    def __init__(self, is_disconnected: bool):
+        self._is_disconnected = is_disconnected
+
+    async def is_disconnected(self) -> bool:
+        return self._is_disconnected
+
+@pytest.fixture
+def slow_generator(monkeypatch):
+    generator = SlowStreamingGenerator()
+    monkeypatch.setattr(content, "get_ai_generator", lambda: generator)
+    return generator
+
+# AIContentGenerator.generate
+
+def test_timeout_aborts_with_partial_content():
+    generator = SlowStreamingGenerator()
+
+    with pytest.raises(GenerationAborted) as exc_info:
+        asyncio.run(generator.generate(**GENERATE_ARGS, timeout=0.18))
+
+    aborted = exc_info.value
+    assert aborted.reason == "timed_out"
+    assert aborted.partial_content.startswith("word0 ")
+    assert aborted.partial_content != full_text(generator.chunk_count)
+    assert aborted.model_used == "stub-model"
+    assert generator.provider_cancelled
+
+def test_client_disconnect_cancels_provider():
+    generator = SlowStreamingGenerator()
+
+    with pytest.raises(GenerationAborted) as exc_info:
+        asyncio.run(generator.generate(**GENERATE_ARGS, is_disconnected=disconnected))
+
+    assert exc_info.value.reason == "cancelled"
+    assert exc_info.value.model_used == "stub-model"
+    assert generator.provider_cancelled
+
+def test_generation_within_budget_returns_normally():
+    generator = SlowStreamingGenerator(chunk_count=3, delay=0.01)
+
+    async def connected() -> bool:
+        return False
+
+    text, model_used = asyncio.run(generator.generate(
+        **GENERATE_ARGS, is_disconnected=connected, timeout=5
+    ))
+
+    assert text == full_text(3)
+    assert model_used == "stub-model"
+    assert not generator.provider_cancelled
+
+def test_result_finished_during_disconnect_probe_is_kept():
+    generator = SlowStreamingGenerator(chunk_count=2, delay=0.01)
+
+    async def slow_probe() -> bool:
+        # The provider completes while this probe is still awaiting
+        await asyncio.sleep(0.2)
+        return True
+
+    text, _ = asyncio.run(generator.generate(**GENERATE_ARGS, is_disconnected=slow_probe))
+
+    assert text == full_text(2)
+    assert not generator.provider_cancelled
+
+# /api/generate
+
+def call_route(db, user, is_disconnected, idempotency_key=None):
+    return content.generate_content(
+        request=GenerateRequest(**GENERATE_ARGS),
+        http_request=FakeHTTPRequest(is_disconnected=is_disconnected),
+        db=db,
+        current_user=user,
+        idempotency_key=idempotency_key
+    )
+
+def test_route_times_out_with_504_and_stores_timed_out_row(db, user, slow_generator, monkeypatch):
+    from main import app
+
+    monkeypatch.setattr(settings, "GENERATION_TIMEOUT_SECONDS", 0.12)
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_current_user] = lambda: user
+    try:
+        response = TestClient(app).post("/api/generate", json=GENERATE_ARGS)
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 504
+    row = db.query(ContentGeneration).one()
+    assert row.status == "timed_out"
+    assert row.model_used == "stub-model"
+    assert row.generated_content.startswith("word0 ")
+    assert slow_generator.provider_cancelled
+
+def test_route_disconnect_returns_499_and_stores_cancelled_row(db, user, slow_generator):
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(call_route(db, user, True))
+
+    assert exc_info.value.status_code == 499
+    assert db.query(ContentGeneration).one().status == "cancelled"
+    assert slow_generator.provider_cancelled
+
+def test_keyed_disconnect_keeps_generating_when_retry_attaches(db, user, slow_generator, monkeypatch):
+    monkeypatch.setattr(settings, "IDEMPOTENCY_DISCONNECT_GRACE_SECONDS", 2)
+    slow_generator.chunk_count = 30
+
+    async def scenario():
+        original = asyncio.create_task(call_route(db, user, True, idempotency_key="retry-safe"))
+        # Arrive after the first disconnect probe, inside the grace period
+        await asyncio.sleep(0.7)
+        retry = asyncio.create_task(call_route(db, user, False, idempotency_key="retry-safe"))
+        return await asyncio.gather(original, retry)
+
+    original, retry = asyncio.run(scenario())
+
+    assert original == retry
+    assert retry["generated_content"] == full_text(30)
+    assert retry["status"] == "completed"
+    assert db.query(ContentGeneration).one().status == "completed"
+    assert not slow_generator.provider_cancelled
+
+def test_keyed_disconnect_cancels_when_no_retry_attaches(db, user, slow_generator, monkeypatch):
+    monkeypatch.setattr(settings, "IDEMPOTENCY_DISCONNECT_GRACE_SECONDS", 0.1)
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(call_route(db, user, True, idempotency_key="abandoned"))
+
+    assert exc_info.value.status_code == 499
+    assert db.query(ContentGeneration).one().status == "cancelled"
+    assert slow_generator.provider_cancelled
+    assert db.query(IdempotencyKey).count() == 0
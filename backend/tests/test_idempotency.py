@@ -0,0 +1,136 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app import idempotency
+from app.idempotency import hash_request, run_idempotent
+from app.models import IdempotencyKey
+
+REQUEST_HASH = hash_request({"product": "Widget"})
+
+class CountingProducer:
+    """Stand-in for the provider call that counts how often it actually runs."""
+    
+    def __init__(self, delay: float = 0, fail_first: bool = False):
+        self.calls = 0
+        self.delay = delay
+        self.fail_first = fail_first
+    
+    async def __call__(self) -> dict:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail_first and self.calls == 1:
+            raise HTTPException(status_code=500, detail="provider down")
+        return {"id": self.calls, "generated_content": f"content {self.calls}"}
+
+def test_replay_after_completion_returns_stored_body(db, user):
+    produce = CountingProducer()
+    
+    async def scenario():
+        first = await run_idempotent(db, user.id, "key-1", REQUEST_HASH, produce)
+        second = await run_idempotent(db, user.id, "key-1", REQUEST_HASH, produce)
+        return first, second
+    
+    first, second = asyncio.run(scenario())
+    
+    assert first == second == {"id": 1, "generated_content": "content 1"}
+    assert produce.calls == 1
+    record = db.query(IdempotencyKey).one()
+    assert record.status == idempotency.STATUS_COMPLETED
+    assert json.loads(record.response_body) == first
+
+def test_concurrent_retry_attaches_to_original(db, user):
+    produce = CountingProducer(delay=0.2)
+    
+    async def scenario():
+        original = asyncio.create_task(run_idempotent(db, user.id, "key-1", REQUEST_HASH, produce))
+        await asyncio.sleep(0.05)
+        retry = asyncio.create_task(run_idempotent(db, user.id, "key-1", REQUEST_HASH, produce))
+        return await asyncio.gather(original, retry)
+    
+    original, retry = asyncio.run(scenario())
+    
+    assert original == retry
+    assert produce.calls == 1
+
+def test_retry_on_other_worker_polls_until_completed(db, user, monkeypatch):
+    monkeypatch.setattr(idempotency, "POLL_INTERVAL_SECONDS", 0.01)
+    # Simulate another worker holding the claim: a row but no in-process future
+    record = IdempotencyKey(
+        user_id=user.id,
+        key="key-1",
+        request_hash=REQUEST_HASH,
+        status=idempotency.STATUS_IN_PROGRESS,
+        expires_at=datetime.utcnow() + timedelta(minutes=5)
+    )
+    db.add(record)
+    db.commit()
+    produce = CountingProducer()
+    
+    async def complete_elsewhere():
+        await asyncio.sleep(0.05)
+        record.status = idempotency.STATUS_COMPLETED
+        record.response_body = json.dumps({"id": 42})
+        db.commit()
+    
+    async def scenario():
+        retry = asyncio.create_task(run_idempotent(db, user.id, "key-1", REQUEST_HASH, produce))
+        await complete_elsewhere()
+        return await retry
+    
+    assert asyncio.run(scenario()) == {"id": 42}
+    assert produce.calls == 0
+
+def test_reused_key_with_different_body_is_rejected(db, user):
+    produce = CountingProducer()
+    asyncio.run(run_idempotent(db, user.id, "key-1", REQUEST_HASH, produce))
+    
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(run_idempotent(
+            db, user.id, "key-1", hash_request({"product": "Gadget"}), produce
+        ))
+    
+    assert exc_info.value.status_code == 422
+    assert produce.calls == 1
+
+def test_failed_original_releases_key_for_retry(db, user):
+    produce = CountingProducer(fail_first=True)
+    
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(run_idempotent(db, user.id, "key-1", REQUEST_HASH, produce))
+    assert exc_info.value.status_code == 500
+    assert db.query(IdempotencyKey).count() == 0
+    
+    body = asyncio.run(run_idempotent(db, user.id, "key-1", REQUEST_HASH, produce))
+    
+    assert body == {"id": 2, "generated_content": "content 2"}
+    assert produce.calls == 2
+
+def test_failed_commit_releases_key_and_attached_retry(db, user, monkeypatch):
+    produce = CountingProducer(delay=0.1)
+    real_commit = db.commit
+    
+    def failing_commit():
+        # Let the claim commit, then fail the commit that stores the response
+        if produce.calls:
+            raise RuntimeError("database unavailable")
+        real_commit()
+    
+    monkeypatch.setattr(db, "commit", failing_commit)
+    
+    async def scenario():
+        original = asyncio.create_task(run_idempotent(db, user.id, "key-1", REQUEST_HASH, produce))
+        await asyncio.sleep(0.02)
+        retry = asyncio.create_task(run_idempotent(db, user.id, "key-1", REQUEST_HASH, produce))
+        return await asyncio.wait_for(
+            asyncio.gather(original, retry, return_exceptions=True), timeout=2
+        )
+    
+    original, retry = asyncio.run(scenario())
+    
+    assert isinstance(original, RuntimeError)
+    assert isinstance(retry, RuntimeError)
+    assert idempotency._in_flight == {}
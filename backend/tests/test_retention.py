@@ -0,0 +1,151 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import retention
+from app.auth import get_current_user
+from app.config import settings
+from app.database import get_db
+from app.models import ContentGeneration, ContentGenerationArchive, IdempotencyKey
+
+def add_generations(db, user, count, age_days, content_type="blog"):
+    created_at = datetime.utcnow() - timedelta(days=age_days)
+    db.add_all([
+        ContentGeneration(
+            user_id=user.id,
+            content_type=content_type,
+            tone="casual",
+            length="short",
+            product="Widget",
+            audience="devs",
+            generated_content="text",
+            model_used="stub-model",
+            created_at=created_at
+        )
+        for _ in range(count)
+    ])
+    db.commit()
+
+def run_sweep(db):
+    return retention.sweep_once(session_factory=lambda: db)
+
+@pytest.fixture
+def retention_days(monkeypatch):
+    monkeypatch.setattr(settings, "HISTORY_RETENTION_DAYS", 30)
+    monkeypatch.setattr(settings, "DELETE_BATCH_SIZE", 3)
+    monkeypatch.setattr(retention, "BATCH_PAUSE_SECONDS", 0)
+
+@pytest.fixture
+def client(db, user):
+    from main import app
+    
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_current_user] = lambda: user
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+def test_sweep_deletes_old_generations_in_batches(db, user, retention_days, monkeypatch):
+    monkeypatch.setattr(settings, "HISTORY_RETENTION_MODE", "delete")
+    add_generations(db, user, 7, age_days=40)
+    add_generations(db, user, 2, age_days=1)
+    
+    assert run_sweep(db)["generations"] == 7
+    assert db.query(ContentGeneration).count() == 2
+    assert db.query(ContentGenerationArchive).count() == 0
+
+def test_sweep_archives_old_generations(db, user, retention_days, monkeypatch):
+    monkeypatch.setattr(settings, "HISTORY_RETENTION_MODE", "archive")
+    add_generations(db, user, 7, age_days=40)
+    add_generations(db, user, 2, age_days=1)
+    
+    assert run_sweep(db)["generations"] == 7
+    assert db.query(ContentGeneration).count() == 2
+    assert db.query(ContentGenerationArchive).count() == 7
+
+def test_sweep_purges_only_expired_idempotency_keys(db, user, retention_days):
+    now = datetime.utcnow()
+    db.add_all([
+        IdempotencyKey(user_id=user.id, key="old", request_hash="h",
+                       status="completed", expires_at=now - timedelta(hours=1)),
+        IdempotencyKey(user_id=user.id, key="live", request_hash="h",
+                       status="completed", expires_at=now + timedelta(hours=1)),
+    ])
+    db.commit()
+    
+    assert run_sweep(db)["idempotency_keys"] == 1
+    assert [k.key for k in db.query(IdempotencyKey).all()] == ["live"]
+
+def test_stop_event_halts_before_next_batch(db, user, retention_days):
+    add_generations(db, user, 5, age_days=40)
+    stop = threading.Event()
+    stop.set()
+    
+    filters = [ContentGeneration.user_id == user.id]
+    assert retention.delete_in_batches(db, ContentGeneration, filters, stop=stop) == 0
+    assert retention.archive_in_batches(db, filters, stop=stop) == 0
+    assert db.query(ContentGeneration).count() == 5
+
+def test_cancelled_sweeper_waits_for_running_sweep(monkeypatch):
+    started = threading.Event()
+    finished = threading.Event()
+    
+    def blocking_sweep(stop):
+        started.set()
+        stop.wait(timeout=2)  # a batch loop noticing the stop request
+        finished.set()
+        return {}
+    
+    monkeypatch.setattr(retention, "sweep_once", blocking_sweep)
+    
+    async def scenario():
+        stop = threading.Event()
+        sweeper = asyncio.create_task(retention.retention_sweeper(stop))
+        await asyncio.to_thread(started.wait, 2)
+        sweeper.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await sweeper
+        return finished.is_set()
+    
+    assert asyncio.run(scenario())
+
+def test_bulk_delete_applies_filters(db, user, client):
+    add_generations(db, user, 3, age_days=1, content_type="blog")
+    add_generations(db, user, 2, age_days=1, content_type="email")
+    add_generations(db, user, 1, age_days=40, content_type="email")
+    
+    cutoff = (datetime.utcnow() - timedelta(days=10)).isoformat()
+    response = client.delete(
+        "/api/history", params={"content_type": "email", "created_after": cutoff}
+    )
+    
+    assert response.status_code == 200
+    assert response.json() == {"deleted": 2}
+    remaining = db.query(ContentGeneration).all()
+    assert sorted(g.content_type for g in remaining) == ["blog", "blog", "blog", "email"]
+
+def test_bulk_delete_by_ids_only_touches_own_rows(db, user, client):
+    add_generations(db, user, 3, age_days=1)
+    ids = [g.id for g in db.query(ContentGeneration).all()]
+    
+    response = client.delete("/api/history", params={"ids": ids[:2] + [9999]})
+    
+    assert response.json() == {"deleted": 2}
+    assert [g.id for g in db.query(ContentGeneration).all()] == ids[2:]
+
+def test_bulk_delete_requires_a_filter(db, user, client):
+    add_generations(db, user, 2, age_days=1)
+    
+    response = client.delete("/api/history")
+    
+    assert response.status_code == 400
+    assert db.query(ContentGeneration).count() == 2
+
+def test_single_delete_returns_404_for_missing_row(db, user, client):
+    add_generations(db, user, 1, age_days=1)
+    content_id = db.query(ContentGeneration).one().id
+    
+    assert client.delete(f"/api/history/{content_id}").status_code == 204
+    assert client.delete(f"/api/history/{content_id}").status_code == 404
@@ -0,0 +1,50 @@
+from sqlalchemy import create_engine, inspect, text
+
+from app import database
+from app.database import upgrade_schema
+
+def make_legacy_engine():
+    """A database created before the status column existed."""
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE content_generations ("
+            "id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, "
+            "generated_content TEXT NOT NULL, created_at DATETIME)"
+        ))
+        conn.execute(text(
+            "INSERT INTO content_generations (id, user_id, generated_content) VALUES (1, 1, 'old')"
+        ))
+    return engine
+
+def test_upgrade_schema_upgrades_existing_table():
+    engine = make_legacy_engine()
+    
+    upgrade_schema(engine)
+    upgrade_schema(engine)  # running again is a no-op
+    
+    inspector = inspect(engine)
+    columns = {c["name"] for c in inspector.get_columns("content_generations")}
+    assert "status" in columns
+    indexes = {i["name"] for i in inspector.get_indexes("content_generations")}
+    assert "ix_content_generations_created_at" in indexes
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT status FROM content_generations")).scalar() == "completed"
+
+def test_upgrade_schema_tolerates_another_worker_adding_the_column(monkeypatch):
+    engine = make_legacy_engine()
+    upgrade_schema(engine)
+    
+    # Simulate losing the race: our check ran before another worker's ALTER
+    real_has_column = database._has_column
+    checks = []
+    
+    def stale_then_real(bind, table, column):
+        checks.append(column)
+        return False if len(checks) == 1 else real_has_column(bind, table, column)
+    
+    monkeypatch.setattr(database, "_has_column", stale_then_real)
+    
+    upgrade_schema(engine)  # the duplicate ALTER fails but must not raise
+    
+    assert checks == ["status", "status"]
@@ -25,10 +25,18 @@ export interface GenerateRequest {
   extra_instructions?: string;
 }
 
+export interface HistoryDeleteFilters {
+  ids?: number[];
+  created_after?: string;
+  created_before?: string;
+  content_type?: 'blog' | 'email' | 'social';
+}
+
 export interface GeneratedContent {
   id: number;
   generated_content: string;
   model_used: string;
+  status: 'completed' | 'cancelled' | 'timed_out';
   created_at: string;
 }
 
@@ -42,6 +50,7 @@ export interface ContentHistory {
   extra_instructions?: string;
   generated_content: string;
   model_used: string;
+  status: 'completed' | 'cancelled' | 'timed_out';
   created_at: string;
 }
 
@@ -85,15 +94,30 @@ class APIClient {
   }
 
   // Content generation endpoints
-  async generateContent(request: GenerateRequest): Promise<GeneratedContent> {
-    const response = await fetch(`${this.baseURL}/api/generate`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-        ...this.getAuthHeader(),
-      },
-      body: JSON.stringify(request),
-    });
+  // The same Idempotency-Key is sent on every retry so the backend returns
+  // the original generation instead of calling the AI provider again.
+  async generateContent(
+    request: GenerateRequest,
+    idempotencyKey: string = crypto.randomUUID(),
+    retries: number = 1
+  ): Promise<GeneratedContent> {
+    let response: Response;
+    try {
+      response = await fetch(`${this.baseURL}/api/generate`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Idempotency-Key': idempotencyKey,
+          ...this.getAuthHeader(),
+        },
+        body: JSON.stringify(request),
+      });
+    } catch (err) {
+      if (retries > 0) {
+        return this.generateContent(request, idempotencyKey, retries - 1);
+      }
+      throw err;
+    }
     return this.handleResponse<GeneratedContent>(response);
   }
 
@@ -121,6 +145,20 @@ class APIClient {
     }
   }
 
+  async deleteHistory(filters: HistoryDeleteFilters): Promise<{ deleted: number }> {
+    const params = new URLSearchParams();
+    filters.ids?.forEach((id) => params.append('ids', String(id)));
+    if (filters.created_after) params.append('created_after', filters.created_after);
+    if (filters.created_before) params.append('created_before', filters.created_before);
+    if (filters.content_type) params.append('content_type', filters.content_type);
+
+    const response = await fetch(`${this.baseURL}/api/history?${params}`, {
+      method: 'DELETE',
+      headers: this.getAuthHeader(),
+    });
+    return this.handleResponse<{ deleted: number }>(response);
+  }
+
   // Health check
   async healthCheck(): Promise<{ status: string; service: string; version: string }> {
     const response = await fetch(`${this.baseURL}/health`);